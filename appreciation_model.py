@@ -0,0 +1,389 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+from textblob.tokenizers import word_tokenize
+from textblob.utils import strip_punc
+
+from near_duplicates import add_to_index, minhash_signatures, new_lsh_index, query_index
+
+LABELS_PATH = "appreciation_labels.jsonl"
+MODELS_DIRECTORY = "models"
+
+def get_words(document):
+	"""
+	Input: a message.
+	Output: the set of words that the message adds to the vocabulary, as in the NaiveBayesClassifier of TextBlob.
+	"""
+	return set(word_tokenize(document, include_punc=False))
+
+def get_tokens(document):
+	"""
+	Input: a message.
+	Output: the set of words in the message with the punctuation at both ends removed, as in the NaiveBayesClassifier of TextBlob.
+			A word of the vocabulary such as "'ll" is therefore never contained in a message, just like in TextBlob.
+	"""
+	return set(strip_punc(w, all=False) for w in word_tokenize(document, include_punc=False))
+
+class IncrementalNaiveBayesClassifier(object):
+	"""
+	A Naive Bayesian classifier with the same features as the NaiveBayesClassifier of TextBlob,
+	"contains(word)" for every word in the training data, which can be updated with new examples
+	without training again from the whole dataset.
+
+	The classifier only stores count tables:
+	label_counts[label] is the number of examples with the label.
+	word_counts[label][word] is the number of examples with the label that contain the word.
+	vocabulary is the set of the words in all the examples.
+
+	Like NLTK, the probabilities are estimated with the expected likelihood estimate, which adds 0.5 to every count:
+	|  P(label) = (label_counts[label] + 0.5) / (number of examples + 0.5 * number of labels)
+	|  P(contains(word) = value | label) = (number of examples with the label and the value + 0.5) / (label_counts[label] + 0.5 * B)
+	where B is the number of values, True and/or False, that contains(word) takes in all the examples.
+	"""
+
+	def __init__(self, label_counts=None, word_counts=None, vocabulary=None, version=0, lines_seen=0, lines_hash=None,
+				 validation_correct=0, validation_total=0, leakage_index=None):
+		self.label_counts = Counter(label_counts or {})
+		self.word_counts = dict((label, Counter(counts)) for label, counts in (word_counts or {}).items())
+		self.vocabulary = set(vocabulary or [])
+		self.version = version # the version of the last published snapshot
+		self.lines_seen = lines_seen # the number of lines of the labels file that have been learned
+		self.lines_hash = lines_hash # the hash of those lines, to detect when a learned line is edited
+		# the number of validation examples classified correctly before they were learned, and the number of validation examples
+		self.validation_correct = validation_correct
+		self.validation_total = validation_total
+		# the locality-sensitive hashing indexes of the "train" and "validation" examples learned, to find near duplicates of new examples
+		self.leakage_index = leakage_index
+		self._log_probs = None
+
+	def partial_fit(self, examples):
+		"""
+		Input: a list of (message, label) tuples.
+		Output: the classifier itself.
+
+		Only the counts of the labels and the words of the new examples are added to the count tables,
+		so the time taken is proportional to the number of new examples.
+		The log probabilities are computed again from the count tables the next time a message is classified.
+		"""
+		for text, label in examples:
+			self.label_counts[label] += 1
+			self.word_counts.setdefault(label, Counter()).update(get_tokens(text))
+			self.vocabulary.update(get_words(text))
+
+		self._log_probs = None
+		return self
+
+	def _compute_log_probs(self):
+		"""
+		Output: a dictionary that maps each label to a tuple of
+				prior: log P(label) + the sum of log P(contains(word) = False | label) over the vocabulary.
+				delta: maps a word to log P(contains(word) = True | label) - log P(contains(word) = False | label).
+
+		A message is scored by adding delta of the words it contains to prior, so classifying a message does not
+		need to go through the whole vocabulary.
+		"""
+		total = sum(self.label_counts.values())
+		containing = Counter()
+		for counts in self.word_counts.values():
+			containing.update(counts)
+
+		log_probs = {}
+		for label, n in self.label_counts.items():
+			counts = self.word_counts.get(label, Counter())
+			prior = math.log((n + 0.5) / (total + 0.5 * len(self.label_counts)))
+			delta = {}
+			for word in self.vocabulary:
+				count = counts[word]
+				bins = (containing[word] > 0) + (containing[word] < total)
+				prior += math.log((n - count + 0.5) / (n + 0.5 * bins))
+				delta[word] = math.log(count + 0.5) - math.log(n - count + 0.5)
+			log_probs[label] = (prior, delta)
+
+		return log_probs
+
+	def prob_classify(self, text):
+		"""
+		Input: a message.
+		Output: a dictionary that maps each label to the probability of the message having the label.
+		"""
+		if self._log_probs is None:
+			self._log_probs = self._compute_log_probs()
+
+		tokens = get_tokens(text) & self.vocabulary
+		scores = {}
+		for label, (prior, delta) in self._log_probs.items():
+			scores[label] = prior + sum(delta[word] for word in tokens)
+
+		# divide by P(features), the sum over the labels, without leaving the log space to avoid underflow
+		highest = max(scores.values())
+		log_total = highest + math.log(sum(math.exp(score - highest) for score in scores.values()))
+		return dict((label, math.exp(score - log_total)) for label, score in scores.items())
+
+	def classify(self, text):
+		"""
+		Input: a message.
+		Output: the most probable label of the message.
+		"""
+		prob_dist = self.prob_classify(text)
+		return max(prob_dist, key=prob_dist.get)
+
+	def accuracy(self, examples):
+		"""
+		Input: a list of (message, label) tuples.
+		Output: the proportion of the messages which are classified with the correct label.
+		"""
+		return sum(self.classify(text) == label for text, label in examples) / float(len(examples))
+
+	def validation_accuracy(self):
+		"""
+		Output: the proportion of all the validation examples learned so far which were classified correctly before they were learned,
+				or None if no validation example has been learned.
+		"""
+		if self.validation_total == 0:
+			return None
+
+		return self.validation_correct / float(self.validation_total)
+
+	def to_dict(self):
+		return {"version": self.version, "lines_seen": self.lines_seen, "lines_hash": self.lines_hash,
+				"validation_correct": self.validation_correct, "validation_total": self.validation_total,
+				"label_counts": dict(self.label_counts),
+				"word_counts": dict((label, dict(counts)) for label, counts in self.word_counts.items()),
+				"vocabulary": sorted(self.vocabulary), "leakage_index": self.leakage_index}
+
+	@classmethod
+	def from_dict(cls, d):
+		return cls(d["label_counts"], d["word_counts"], d["vocabulary"], d["version"], d.get("lines_seen", 0), d.get("lines_hash"),
+				   d.get("validation_correct", 0), d.get("validation_total", 0), d.get("leakage_index"))
+
+def read_label_lines(path=LABELS_PATH):
+	"""
+	Input: the path of the labels file.
+	Output: the list of the lines of the labels file.
+
+	Every line of the labels file is a JSON object {"text": ..., "label": ..., "split": "train" or "validation"}.
+	The labelling team appends new examples to the end of the file. Blank lines are allowed and have no example.
+	"""
+	with open(path, "rb") as f:
+		return f.read().decode("utf-8").splitlines(True)
+
+def hash_lines(lines):
+	"""
+	Input: a list of lines of the labels file.
+	Output: the SHA-256 hash of the lines.
+
+	The line breaks at the end of the lines are not hashed, so appending to a file saved without a newline at the end
+	does not change the hash of the last line.
+	"""
+	return hashlib.sha256("\n".join(line.rstrip("\r\n") for line in lines).encode("utf-8")).hexdigest()
+
+def parse_label_lines(lines):
+	"""
+	Input: a list of lines of the labels file.
+	Output: a list of (message, label, split) tuples, one per line which is not blank.
+	"""
+	examples = []
+	for line in lines:
+		if line.strip():
+			example = json.loads(line)
+			examples.append((example["text"], example["label"], example["split"]))
+
+	return examples
+
+def load_labelled_examples(path=LABELS_PATH):
+	"""
+	Input: the path of the labels file.
+	Output: a list of (message, label, split) tuples, one per example in the labels file.
+	"""
+	return parse_label_lines(read_label_lines(path))
+
+def publish_snapshot(cl, directory=MODELS_DIRECTORY):
+	"""
+	Input: a classifier and the directory of the snapshots.
+	Output: the path of the published snapshot.
+
+	The count tables are written to directory/appreciation_model-v<version>.json, where version is one more than the
+	version of the classifier. The old snapshots are kept so that a model can be rolled back.
+
+	The snapshot is first written to a temporary file and then linked to its name, which fails with FileExistsError
+	if another process has already published the same version. Other processes therefore never read a half written
+	snapshot, and a published snapshot is never overwritten.
+	"""
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	name = "appreciation_model-v{:04d}.json".format(cl.version + 1)
+	fd, tmp = tempfile.mkstemp(dir=directory)
+	try:
+		with os.fdopen(fd, "w") as f:
+			f.write(json.dumps(dict(cl.to_dict(), version=cl.version + 1)))
+		os.link(tmp, os.path.join(directory, name))
+	finally:
+		os.remove(tmp)
+
+	cl.version += 1
+	return os.path.join(directory, name)
+
+def load_latest_snapshot(directory=MODELS_DIRECTORY):
+	"""
+	Input: the directory of the snapshots.
+	Output: the classifier of the snapshot with the highest version, or None if no snapshot has been published.
+	"""
+	try:
+		names = [name for name in os.listdir(directory) if re.match(r"appreciation_model-v\d+\.json$", name)]
+	except OSError:
+		return None
+
+	if not names:
+		return None
+
+	with open(os.path.join(directory, max(names, key=lambda name: int(re.findall(r"\d+", name)[0])))) as f:
+		return IncrementalNaiveBayesClassifier.from_dict(json.load(f))
+
+def report_leakage(index, examples, threshold=0.8):
+	"""
+	Input: the leakage index of a classifier, a list of new (message, label, split) examples and the minimum estimated
+		   Jaccard similarity of two near duplicates.
+	Output: the set of the positions, in the list of the validation examples of the new examples,
+			of the validation examples which are near duplicates of a training example.
+
+	Algorithm:
+	1. Compute the MinHash signatures of the new examples only. The signatures of the examples learned before are in the index.
+	2. Add the new training examples to the training index, and query the new validation examples against it,
+	   so they are checked against both the old and the new training examples.
+	3. Query the new training examples against the validation index, which only holds the old validation examples,
+	   and add the new validation examples to it. Every pair of near duplicates is therefore printed once.
+	"""
+	train = [text for text, label, split in examples if split == "train"]
+	validation = [text for text, label, split in examples if split == "validation"]
+	train_signatures = minhash_signatures(train)
+	validation_signatures = minhash_signatures(validation)
+
+	leaked = set()
+	add_to_index(index["train"], train, train_signatures)
+	for i, j in query_index(index["train"], validation_signatures, threshold):
+		print("validation example {!r} is a near duplicate of training example {!r}".format(validation[i], index["train"]["texts"][j]))
+		leaked.add(i)
+
+	for j, i in query_index(index["validation"], train_signatures, threshold):
+		print("validation example {!r} is a near duplicate of training example {!r}".format(index["validation"]["texts"][i], train[j]))
+	add_to_index(index["validation"], validation, validation_signatures)
+
+	return leaked
+
+def learn_labels(cl, lines):
+	"""
+	Input: a classifier loaded from a snapshot (or None) and the lines of the labels file.
+	Output: the classifier updated with the lines it has not learned. The classifier is returned unchanged if there are no new lines.
+
+	Algorithm:
+	1. If there is no classifier, start from an empty classifier. If the lines of the labels file which the snapshot has learned
+	   have been edited since, i.e. their hash does not match the hash in the snapshot, the counts in the snapshot are stale,
+	   so start again from an empty classifier too. So does a snapshot published before the leakage index was added.
+	2. Update the classifier with the new training examples.
+	3. Print the new examples which are near duplicates across the training and validation sets using report_leakage(),
+	   and the accuracy of the classifier on the new validation examples without them.
+	4. Classify the new validation examples, add the number of correct ones and the number of them to the running counts
+	   of the classifier, and update the classifier with the new validation examples.
+
+	The first time, the new lines are the whole labels file, so the classifier is trained with the training set and checked
+	with the validation set as before. Later, the new validation examples are checked before they are learned, and the 90% check
+	in passes_validation() applies to all the validation examples so far, so a few misclassified new examples do not block an update.
+	Only the new lines are learned, but the whole labels file is read to check its hash.
+	"""
+	version = cl.version if cl is not None else 0
+	if cl is None:
+		pass
+	elif cl.lines_seen > len(lines) or cl.lines_hash != hash_lines(lines[:cl.lines_seen]):
+		print("The examples learned by appreciation model version {} have been edited, training again from the whole labels file.".format(cl.version))
+		cl = None
+	elif cl.leakage_index is None:
+		print("Appreciation model version {} has no leakage index, training again from the whole labels file.".format(cl.version))
+		cl = None
+
+	if cl is None:
+		cl = IncrementalNaiveBayesClassifier(version=version, leakage_index={"train": new_lsh_index(), "validation": new_lsh_index()})
+
+	if cl.lines_seen == len(lines):
+		return cl
+
+	examples = parse_label_lines(lines[cl.lines_seen:])
+	train = [(text, label) for text, label, split in examples if split == "train"]
+	validation = [(text, label) for text, label, split in examples if split == "validation"]
+	cl.partial_fit(train)
+
+	leaked = report_leakage(cl.leakage_index, examples)
+	if leaked and len(leaked) < len(validation):
+		print("accuracy on the new validation examples without near duplicates of training examples: {}".format(
+			cl.accuracy([example for i, example in enumerate(validation) if i not in leaked])))
+
+	cl.validation_correct += sum(cl.classify(text) == label for text, label in validation)
+	cl.validation_total += len(validation)
+	cl.partial_fit(validation)
+
+	cl.lines_seen = len(lines)
+	cl.lines_hash = hash_lines(lines)
+	return cl
+
+def passes_validation(cl):
+	"""
+	Input: a classifier.
+	Output: True if the classifier classifies more than 90% of all the validation examples learned so far correctly.
+	"""
+	accuracy = cl.validation_accuracy()
+	return accuracy is not None and accuracy > 0.90
+
+def load_model(labels_path=LABELS_PATH, directory=MODELS_DIRECTORY):
+	"""
+	Input: the path of the labels file and the directory of the snapshots.
+	Output: the classifier of the latest snapshot. If no snapshot has been published, a classifier trained from the labels file,
+			or None if it does not reach 90% accuracy on the validation set.
+
+	Nothing is written to the directory of the snapshots. New examples are only learned by update_model().
+	"""
+	cl = load_latest_snapshot(directory)
+	if cl is None:
+		cl = learn_labels(None, read_label_lines(labels_path))
+
+	return cl if passes_validation(cl) else None
+
+def update_model(labels_path=LABELS_PATH, directory=MODELS_DIRECTORY):
+	"""
+	Input: the path of the labels file and the directory of the snapshots.
+	Output: the latest classifier. It is published even if it does not pass the 90% check of passes_validation(),
+			so that later examples can improve it, but load_model() does not return it until it passes.
+
+	Algorithm:
+	1. Load the latest snapshot and update it with the new lines of the labels file using learn_labels().
+	2. If any line is learned, publish the classifier as a new snapshot.
+	3. If another process publishes the same version first, load its snapshot and start again from step 1.
+	"""
+	while True:
+		cl = load_latest_snapshot(directory)
+		version = cl.version if cl is not None else 0
+		lines_seen = cl.lines_seen if cl is not None else 0
+		lines_hash = cl.lines_hash if cl is not None else None
+
+		cl = learn_labels(cl, read_label_lines(labels_path))
+		if cl.lines_seen == lines_seen and cl.lines_hash == lines_hash:
+			return cl
+
+		try:
+			publish_snapshot(cl, directory)
+			return cl
+		except FileExistsError:
+			print("Another update published appreciation model version {} first, updating again from it.".format(version + 1))
+
+
+if __name__ == "__main__":
+	# python appreciation_model.py [labels file] [snapshot directory]
+	cl = update_model(*sys.argv[1:3])
+	print("appreciation model version {} trained on {} lines of the labels file, accuracy on the validation examples: {}".format(
+		cl.version, cl.lines_seen, cl.validation_accuracy()))
+	if not passes_validation(cl):
+		print("The classifier does not reach 90% accuracy on the validation set, so it is not used until more examples are labelled.")
@@ -0,0 +1,202 @@
+import glob
+import json
+import os
+import numpy as np
+
+from linguistic_analysis import get_final_utterances_from_user, prob_classify_messages, train_appreciation_classifier
+
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = None
+	pq = None
+
+# name and numpy dtype of every column written by the export stage
+TURN_COLUMNS = [("dialogue_id", "U"), ("turn_index", np.int32), ("author", "U"),
+				("word_count", np.int32), ("acts", "U"),
+				("appreciation_label", "U"), ("appreciation_probability", np.float32)]
+
+DIALOGUE_COLUMNS = [("dialogue_id", "U"), ("user_messages", np.int32), ("wizard_messages", np.int32),
+					("user_words", np.int32), ("wizard_words", np.int32),
+					("final_utterance_appreciation_label", "U"), ("final_utterance_appreciation_probability", np.float32),
+					("user_survey_rating", np.float32), ("task_successful", np.int8)]
+
+def word_count(message):
+	"""
+	Input: a message.
+	Output: the number of words in the message, counted the same way as in dataanalysis.py.
+	"""
+	return len(message.split(" "))
+
+def act_names(turn):
+	"""
+	Input: a turn of a dialogue.
+	Output: a string of the names of the dialogue acts in the turn, separated by commas.
+	"""
+	return ",".join(act["name"] for act in turn["labels"].get("acts", []))
+
+def appreciation(messages, cl):
+	"""
+	Input: a list of messages and a trained classifier (or None).
+	Output: a tuple of the list of the labels predicted by the classifier and the list of the probabilities of the messages
+			being "appreciation". If there is no classifier, the labels are empty and the probabilities are NaN.
+
+	The messages are classified with prob_classify_messages(), once per cluster of near duplicates, so the labels are
+	the same as the labels from classify_final_utterances() in linguistic_analysis.py.
+	"""
+	if cl is None:
+		return [""] * len(messages), [float("nan")] * len(messages)
+
+	prob_dists = prob_classify_messages(messages, cl)
+	return [max(p, key=p.get) for p in prob_dists], [p.get("appreciation", 0.0) for p in prob_dists]
+
+def turn_rows(batch, cl):
+	"""
+	Input: a list of (dialogue id, position of the turn, turn) tuples and a trained classifier (or None).
+	Output: a generator of tuples, one per turn, in the order of TURN_COLUMNS.
+	"""
+	user = [turn["text"] for dialogue_id, j, turn in batch if turn["author"] == "user"]
+	labels, probabilities = appreciation(user, cl)
+
+	k = 0
+	for dialogue_id, j, turn in batch:
+		if turn["author"] == "user":
+			label, probability = labels[k], probabilities[k]
+			k += 1
+		else:
+			label, probability = "", float("nan")
+		yield (dialogue_id, j, turn["author"], word_count(turn["text"]), act_names(turn), label, probability)
+
+def iter_turn_features(data, cl, batch_size=100000):
+	"""
+	Input: a dictionary which contains the conversations between a user and the wizard, a trained classifier (or None)
+		   and the number of turns classified at a time.
+	Output: a generator of tuples, one per turn, in the order of TURN_COLUMNS.
+
+	Only the messages sent by the user are classified, because the classifier is trained on the messages of the user.
+	The turns are collected into batches of whole dialogues with about batch_size turns, and the messages of the user
+	in a batch are classified together, once per cluster of near duplicates.
+	"""
+	batch = []
+	for dialogue in data:
+		batch.extend((dialogue["id"], j, turn) for j, turn in enumerate(dialogue["turns"]))
+		if len(batch) >= batch_size:
+			for row in turn_rows(batch, cl):
+				yield row
+			batch = []
+
+	for row in turn_rows(batch, cl):
+		yield row
+
+def iter_dialogue_features(data, cl):
+	"""
+	Input: a dictionary which contains the conversations between a user and the wizard, and a trained classifier (or None).
+	Output: a generator of tuples, one per dialogue, in the order of DIALOGUE_COLUMNS.
+
+	Algorithm:
+	1. The user initiates the conversation and the two take turns, so the messages at even positions are sent by the user
+	   and the messages at odd positions are sent by the wizard.
+	2. Count the messages and the words sent by each side.
+	3. Classify the final utterances of the user of all the dialogues together, as in classify_final_utterances().
+	4. Add the survey answers of the user and the wizard. A missing answer is stored as NaN or -1.
+	"""
+	labels, probabilities = appreciation(get_final_utterances_from_user(data), cl)
+	for dialogue, label, probability in zip(data, labels, probabilities):
+		user = [dialogue["turns"][j]["text"] for j in range(0, len(dialogue["turns"]), 2)]
+		wizard = [dialogue["turns"][j]["text"] for j in range(1, len(dialogue["turns"]), 2)]
+
+		labels = dialogue.get("labels", {})
+		rating = labels.get("userSurveyRating")
+		successful = labels.get("wizardSurveyTaskSuccessful")
+		yield (dialogue["id"], len(user), len(wizard),
+			   sum(word_count(m) for m in user), sum(word_count(m) for m in wizard),
+			   label, probability,
+			   float("nan") if rating is None else rating,
+			   -1 if successful is None else int(successful))
+
+def write_batches(rows, columns, path, batch_size=100000, file_format="parquet"):
+	"""
+	Input: an iterable of rows, the list of (name, dtype) of the columns, the output path without extension,
+		   the number of rows in a batch and the file format ("parquet" or "npz").
+	Output: the number of rows written.
+
+	Algorithm:
+	1. Fill a buffer of one Python list per column until it holds batch_size rows.
+	2. Convert the buffer into numpy arrays, write it out as one compressed chunk and empty the buffer.
+	   For Parquet, every chunk is a row group appended to path.parquet.
+	   For NPZ, every chunk is a separate file path-00000.npz, path-00001.npz, ...
+	3. Write the last, partially filled buffer.
+
+	For NPZ, the chunks of an earlier export to the same path are removed first, so that a smaller export does not leave
+	stale chunks next to the new ones.
+
+	Only one batch is held in memory at a time, so the number of rows that can be exported is not limited by memory.
+	"""
+	if file_format not in ("parquet", "npz"):
+		raise ValueError("file_format must be \"parquet\" or \"npz\", not {!r}".format(file_format))
+	if file_format == "parquet" and pq is None:
+		raise ImportError("pyarrow is required to write Parquet files, use file_format=\"npz\" instead")
+
+	if file_format == "npz":
+		for old_chunk in glob.glob(glob.escape(path) + "-[0-9][0-9][0-9][0-9][0-9].npz"):
+			os.remove(old_chunk)
+
+	names = [name for name, dtype in columns]
+	buffer = [[] for name in names]
+	writer = None
+	chunk = 0
+	total = 0
+
+	def flush():
+		arrays = [np.asarray(values, dtype=dtype) for values, (name, dtype) in zip(buffer, columns)]
+		if file_format == "parquet":
+			nonlocal writer
+			table = pa.Table.from_arrays([pa.array(a) for a in arrays], names=names)
+			if writer is None:
+				writer = pq.ParquetWriter(path + ".parquet", table.schema, compression="snappy")
+			writer.write_table(table)
+		else:
+			np.savez_compressed("{}-{:05d}.npz".format(path, chunk), **dict(zip(names, arrays)))
+		for values in buffer:
+			del values[:]
+
+	try:
+		for row in rows:
+			for values, value in zip(buffer, row):
+				values.append(value)
+			total += 1
+			if len(buffer[0]) == batch_size:
+				flush()
+				chunk += 1
+
+		if buffer[0] or total == 0:
+			flush()
+	finally:
+		if writer is not None:
+			writer.close()
+
+	return total
+
+def export_features(data, directory, batch_size=100000, file_format="parquet", cl=None):
+	"""
+	Input: a dictionary which contains the conversations between a user and the wizard, the output directory,
+		   the number of rows in a batch, the file format ("parquet" or "npz") and optionally a trained classifier.
+	Output: a tuple of the number of turns and the number of dialogues written.
+
+	The per-turn features are written to directory/turns and the per-dialogue features to directory/dialogues.
+	"""
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+
+	turns = write_batches(iter_turn_features(data, cl, batch_size), TURN_COLUMNS,
+						  os.path.join(directory, "turns"), batch_size, file_format)
+	dialogues = write_batches(iter_dialogue_features(data, cl), DIALOGUE_COLUMNS,
+							  os.path.join(directory, "dialogues"), batch_size, file_format)
+	return turns, dialogues
+
+
+if __name__ == "__main__":
+	data = json.load(open("frames.json"))
+	print(export_features(data, "features", file_format="parquet" if pq is not None else "npz",
+						  cl=train_appreciation_classifier()))
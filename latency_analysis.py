@@ -0,0 +1,129 @@
+import json
+from matplotlib import pyplot as plt
+import numpy as np
+
+from linguistic_analysis import get_final_utterances_from_user, train_appreciation_classifier, classify_final_utterances
+
+def get_turn_timestamps(data):
+	"""
+	Input: a dictionary which contains the conversations between a user and the wizard.
+	Output: a tuple of three numpy arrays
+			timestamps: the time in seconds at which each turn is sent, for all the turns of all the dialogues one after another.
+			is_wizard: True if the turn is sent by the wizard, False if it is sent by the user.
+			offsets: the turns of the ith dialogue are timestamps[offsets[i]:offsets[i + 1]].
+
+	The timestamps in frames.json are in milliseconds, so they are divided by 1000.
+	"""
+	lengths = np.fromiter((len(dialogue["turns"]) for dialogue in data), dtype=np.int64, count=len(data))
+	offsets = np.zeros(len(data) + 1, dtype=np.int64)
+	np.cumsum(lengths, out=offsets[1:])
+
+	timestamps = np.fromiter((turn["timestamp"] for dialogue in data for turn in dialogue["turns"]),
+							 dtype=np.float64, count=offsets[-1]) / 1000
+	is_wizard = np.fromiter((turn["author"] == "wizard" for dialogue in data for turn in dialogue["turns"]),
+							dtype=bool, count=offsets[-1])
+
+	return timestamps, is_wizard, offsets
+
+def response_times(timestamps, is_wizard, offsets):
+	"""
+	Input: the output of get_turn_timestamps().
+	Output: a dictionary that maps "Wizard" and "User" to a tuple of two numpy arrays
+			latencies: the number of seconds between a message and the reply from the other side.
+			dialogue_index: the index of the dialogue of each latency.
+
+	The latency of the wizard is the time the wizard takes to reply to the user, and the latency of the user
+	is the time the user takes to think before replying to the wizard.
+
+	Algorithm:
+	1. Label every turn with the index of its dialogue by repeating the index of the dialogue once per turn.
+	2. Use np.diff() to find the time between every turn and the turn before it.
+	3. The difference between the first turn of a dialogue and the last turn of the previous dialogue is not a reply,
+	   so only keep the differences between two turns of the same dialogue.
+	4. A difference is a latency of the wizard if the turn is sent by the wizard and the turn before it is sent by the user,
+	   and vice versa. Consecutive messages from the same side are not replies, so they are ignored.
+	"""
+	dialogue_index = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+	gaps = np.diff(timestamps)
+	same_dialogue = dialogue_index[1:] == dialogue_index[:-1]
+
+	wizard_reply = same_dialogue & is_wizard[1:] & ~is_wizard[:-1]
+	user_reply = same_dialogue & ~is_wizard[1:] & is_wizard[:-1]
+
+	return {"Wizard": (gaps[wizard_reply], dialogue_index[1:][wizard_reply]),
+			"User": (gaps[user_reply], dialogue_index[1:][user_reply])}
+
+def latency_analysis(latencies, role):
+	"""
+	Input: A numpy array of latencies in seconds, and the role ("User" or "Wizard") of the side that replies.
+	Output: a tuple which contains mean, median, standard deviation, 95th percentile and 99th percentile of the latencies.
+			All the values are None, and no histogram is plotted, if there are no latencies.
+
+	Algorithm:
+	1. Plot a histogram of the latencies up to the 99th percentile, so that a few very slow replies do not squeeze the histogram.
+	2. Use np.percentile() to find the 50th (median), 95th and 99th percentiles of the latencies.
+	3. Use np.mean() and np.std() to find the mean and the population standard deviation of the latencies.
+	"""
+	if latencies.size == 0:
+		return None, None, None, None, None
+
+	p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+
+	color = "yellow" if role == "User" else "blue"
+	plt.hist(latencies[latencies <= p99], color="{}".format(color), bins=50, edgecolor='black', linewidth=1.2)
+	plt.ylabel("Frequency")
+	plt.xlabel("Number of Seconds Taken by {} to Reply".format(role))
+	plt.show()
+
+	return round(float(np.mean(latencies)), 2), round(float(p50), 2), round(float(np.std(latencies)), 2), \
+			round(float(p95), 2), round(float(p99), 2)
+
+def correlation_latency_appreciation(latencies, dialogue_index, appreciation):
+	"""
+	Input: The latencies of the wizard and their dialogue index from response_times().
+		   The list of labels of the final utterances of the user from classify_final_utterances().
+	Output: The tuple of Pearson's coefficient of correlation between the mean latency of the wizard in a dialogue and
+			the appreciation at the end of the dialogue, the mean latency in the dialogues ending with appreciation
+			and the mean latency in the dialogues ending without appreciation.
+			The coefficient is None if all the dialogues end with the same label, and a mean latency is None if no dialogue has the label.
+
+	Algorithm:
+	1. Use np.bincount() to sum the latencies and count the replies of the wizard in each dialogue.
+	   The mean latency of a dialogue is the sum divided by the count. Dialogues without any reply from the wizard are ignored.
+	2. Encode the appreciation as 1 and the non-appreciation as 0.
+	3. The Pearson's coefficient of correlation between the mean latency and the 0/1 appreciation is the point-biserial coefficient.
+	"""
+	appreciated = np.array([label == "appreciation" for label in appreciation], dtype=bool)
+	if len(dialogue_index) and dialogue_index.max() >= len(appreciated):
+		raise ValueError("there is no appreciation label for dialogue {}, only {} labels are given "
+						 "(classify_final_utterances() returns no label if the classifier does not reach 90% accuracy)".format(
+						 dialogue_index.max(), len(appreciated)))
+
+	total = np.bincount(dialogue_index, weights=latencies, minlength=len(appreciated))
+	count = np.bincount(dialogue_index, minlength=len(appreciated))
+
+	replied = count > 0
+	mean_latency = total[replied] / count[replied]
+	appreciated = appreciated[replied]
+
+	def group_mean(group):
+		return round(float(np.mean(mean_latency[group])), 2) if group.any() else None
+
+	# the coefficient is undefined when the appreciation is constant
+	coefficient = float(np.corrcoef(mean_latency, appreciated)[0, 1]) if 0 < appreciated.sum() < len(appreciated) else None
+	return coefficient, group_mean(appreciated), group_mean(~appreciated)
+
+
+if __name__ == "__main__":
+	data = json.load(open("frames.json"))
+	latencies = response_times(*get_turn_timestamps(data))
+	print(latency_analysis(latencies["Wizard"][0], "Wizard"))
+	print(latency_analysis(latencies["User"][0], "User"))
+
+	cl = train_appreciation_classifier()
+	if cl is None:
+		print("The classifier does not reach 90% accuracy on the validation set, so the latency is not correlated with appreciation.")
+	else:
+		appreciation = classify_final_utterances(get_final_utterances_from_user(data), cl)
+		print("correlation of latency of the wizard and appreciation: ",
+			  correlation_latency_appreciation(latencies["Wizard"][0], latencies["Wizard"][1], appreciation))
@@ -0,0 +1,255 @@
+import json
+import re
+import zlib
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+def normalize(text):
+	"""
+	Input: a message.
+	Output: the message in lower case, with the punctuation removed and the whitespace collapsed,
+			e.g. "Well what about in Goiania.?" becomes "well what about in goiania".
+	"""
+	return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+def get_shingles(text, k=3):
+	"""
+	Input: a message and the length of the shingles.
+	Output: the set of the hashes of all the substrings of k characters (shingles) in the normalized message.
+			A message shorter than k characters is a single shingle, so that every message has at least one shingle.
+	"""
+	text = normalize(text)
+	shingles = set(text[i:i + k] for i in range(max(len(text) - k + 1, 1)))
+	return set(zlib.crc32(s.encode("utf-8")) for s in shingles)
+
+def minhash_batch(shingles, a, b, perm_chunk):
+	"""
+	Input: a list of sets of shingle hashes, the coefficients a and b of the hash functions and the number of hash functions applied at a time.
+	Output: a numpy array of shape (number of sets, number of hash functions) of the MinHash signatures of the sets.
+
+	Algorithm:
+	1. Put the hashes of the shingles of all the sets one after another in a single array,
+	   and record the position where the shingles of each set start.
+	2. Apply perm_chunk hash functions to the array at once, which gives a matrix of shape (perm_chunk, number of shingles).
+	   The matrix is updated in place, so there is no temporary matrix of the same size.
+	3. Use np.minimum.reduceat() to take the minimum of every hash function over the shingles of each set.
+	"""
+	lengths = np.array([len(s) for s in shingles], dtype=np.int64)
+	offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+	hashes = np.fromiter((h for s in shingles for h in s), dtype=np.uint64, count=lengths.sum())
+
+	signatures = np.empty((len(shingles), len(a)), dtype=np.uint32)
+	for start in range(0, len(a), perm_chunk):
+		permuted = a[start:start + perm_chunk] * hashes
+		permuted += b[start:start + perm_chunk]
+		permuted %= MERSENNE_PRIME
+		permuted &= MAX_HASH
+		signatures[:, start:start + perm_chunk] = np.minimum.reduceat(permuted, offsets, axis=1).T
+
+	return signatures
+
+def minhash_signatures(texts, num_perm=128, k=3, max_shingles=65536, perm_chunk=32, seed=1):
+	"""
+	Input: a list of messages, the number of hash functions, the length of the shingles, the number of shingles
+		   hashed at a time, the number of hash functions applied at a time and the seed of the hash functions.
+	Output: a numpy array of shape (number of messages, num_perm). Row i is the MinHash signature of the ith message.
+
+	The probability that two signatures agree in a column is the Jaccard similarity of the two sets of shingles,
+	so the Jaccard similarity can be estimated without comparing the shingles.
+
+	Algorithm:
+	1. Draw num_perm random hash functions h(x) = (a * x + b) mod p.
+	2. Collect the shingles of the messages into a batch until the batch holds max_shingles shingles,
+	   and compute the signatures of the batch with minhash_batch().
+
+	Apart from the signatures, the memory used is bounded by perm_chunk * max_shingles 8-byte integers (16 MB by default),
+	however many and however long the messages are. Only a single message with more than max_shingles shingles makes a larger batch.
+	"""
+	generator = np.random.RandomState(seed)
+	a = generator.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)[:, np.newaxis]
+	b = generator.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)[:, np.newaxis]
+
+	signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+	batch = []
+	batch_shingles = 0
+	start = 0
+	for text in texts:
+		shingles = get_shingles(text, k)
+		if batch and batch_shingles + len(shingles) > max_shingles:
+			signatures[start:start + len(batch)] = minhash_batch(batch, a, b, perm_chunk)
+			start += len(batch)
+			batch = []
+			batch_shingles = 0
+		batch.append(shingles)
+		batch_shingles += len(shingles)
+
+	if batch:
+		signatures[start:start + len(batch)] = minhash_batch(batch, a, b, perm_chunk)
+
+	return signatures
+
+def connected_components(n, first, second):
+	"""
+	Input: the number of nodes and two numpy arrays of node indices. There is an edge between first[i] and second[i].
+	Output: a numpy array which maps each node to the smallest node in its connected component.
+
+	Algorithm:
+	1. Label each node with its own index.
+	2. Across every edge, lower the label of both nodes to the smaller label of the two, using np.minimum.at().
+	3. Replace each label by the label of the node it points to, so the labels jump along the chains.
+	4. Repeat step 2 and 3 until the labels do not change.
+	"""
+	labels = np.arange(n)
+	while True:
+		previous = labels.copy()
+		smaller = np.minimum(labels[first], labels[second])
+		np.minimum.at(labels, first, smaller)
+		np.minimum.at(labels, second, smaller)
+		labels = labels[labels]
+		if np.array_equal(labels, previous):
+			return labels
+
+def near_duplicate_clusters(texts, threshold=0.8, num_perm=128, bands=16):
+	"""
+	Input: a list of messages, the minimum estimated Jaccard similarity of two near duplicates,
+		   the number of hash functions and the number of bands of the locality-sensitive hashing index.
+	Output: a numpy array which maps each message to the index of the first message in its cluster of near duplicates.
+
+	Algorithm:
+	1. Compute the MinHash signatures of the messages.
+	2. Split the signatures into bands of num_perm / bands columns. Two messages whose signatures are identical in
+	   at least one band are candidates, which is likely if their Jaccard similarity is above (1 / bands) ** (bands / num_perm).
+	3. For each band, use np.unique() to put the messages with the same band into the same bucket, and sort the messages
+	   by bucket. Consecutive messages in a bucket are candidate pairs, so a bucket of m messages gives m - 1 pairs
+	   instead of m * (m - 1) / 2.
+	4. Keep the candidate pairs whose signatures agree in at least threshold of the columns.
+	5. The clusters are the connected components of the kept pairs.
+
+	Every step is a sort or a pass over the messages, so the time taken grows almost linearly with the number of messages.
+	"""
+	signatures = minhash_signatures(texts, num_perm)
+	rows = num_perm // bands
+
+	first = []
+	second = []
+	for band in range(bands):
+		_, bucket = np.unique(signatures[:, band * rows:(band + 1) * rows], axis=0, return_inverse=True)
+		bucket = bucket.ravel()
+		order = np.argsort(bucket, kind="stable")
+		same_bucket = bucket[order[1:]] == bucket[order[:-1]]
+		first.append(order[:-1][same_bucket])
+		second.append(order[1:][same_bucket])
+
+	first = np.concatenate(first)
+	second = np.concatenate(second)
+	similar = np.mean(signatures[first] == signatures[second], axis=1) >= threshold
+
+	return connected_components(len(texts), first[similar], second[similar])
+
+def cluster_representatives(texts, threshold=0.8):
+	"""
+	Input: a list of messages and the minimum estimated Jaccard similarity of two near duplicates.
+	Output: a tuple of
+			representatives: the list of the first message of every cluster of near duplicates.
+			weights: a numpy array of the number of messages in every cluster.
+			cluster: a numpy array which maps each message to the index of its cluster in representatives.
+
+	A statistic that is computed once per representative and weighted by weights is the same as computing it once per message.
+	"""
+	if not texts:
+		return [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+	first_message, cluster = np.unique(near_duplicate_clusters(texts, threshold), return_inverse=True)
+	return [texts[i] for i in first_message], np.bincount(cluster.ravel()), cluster.ravel()
+
+def find_leakage(train, validation, threshold=0.8):
+	"""
+	Input: a list of training messages, a list of validation messages and the minimum estimated Jaccard similarity of two near duplicates.
+	Output: a list of (validation index, training index) tuples. The validation message is a near duplicate of the training message.
+
+	A validation message that is a near duplicate of a training message measures how well the classifier remembers the training set
+	rather than how well it classifies new messages, so it makes the accuracy on the validation set too high.
+	"""
+	cluster = near_duplicate_clusters(list(train) + list(validation), threshold)
+	first_train = {}
+	for i in range(len(train)):
+		first_train.setdefault(cluster[i], i)
+
+	return [(i, first_train[cluster[len(train) + i]]) for i in range(len(validation))
+			if cluster[len(train) + i] in first_train]
+
+def band_keys(signatures, bands=16):
+	"""
+	Input: a numpy array of MinHash signatures and the number of bands of the locality-sensitive hashing index.
+	Output: a list of lists of strings. The jth string of the ith list is the key of the bucket of the jth band of the ith signature,
+			e.g. "3:0f1a...", so that two signatures have the same key if and only if they are identical in the band.
+
+	The bands are written as little endian hexadecimal, so that the keys are the same on every machine.
+	"""
+	rows = signatures.shape[1] // bands
+	signatures = signatures.astype("<u4")
+	return [["{}:{}".format(band, signature[band * rows:(band + 1) * rows].tobytes().hex()) for band in range(bands)]
+			for signature in signatures]
+
+def new_lsh_index():
+	"""
+	Output: an empty locality-sensitive hashing index, a dictionary that can be saved as JSON with
+			texts: the list of the messages in the index.
+			signatures: the list of the MinHash signatures of the messages.
+			buckets: a dictionary that maps the key of a bucket from band_keys() to the positions of the messages in the bucket.
+	"""
+	return {"texts": [], "signatures": [], "buckets": {}}
+
+def add_to_index(index, texts, signatures, bands=16):
+	"""
+	Input: an index from new_lsh_index(), a list of messages, the numpy array of their MinHash signatures and the number of bands.
+	Output: None. The messages are appended to the index.
+	"""
+	for text, signature, keys in zip(texts, signatures, band_keys(signatures, bands)):
+		for key in keys:
+			index["buckets"].setdefault(key, []).append(len(index["texts"]))
+		index["texts"].append(text)
+		index["signatures"].append(signature.tolist())
+
+def query_index(index, signatures, threshold=0.8, bands=16):
+	"""
+	Input: an index from new_lsh_index(), a numpy array of MinHash signatures, the minimum estimated Jaccard similarity
+		   of two near duplicates and the number of bands.
+	Output: a list of (signature position, index position) tuples. The message with the signature is a near duplicate of
+			the message at the position in the index.
+
+	Only the messages in the buckets of the signatures are compared, so a query does not compare against the whole index.
+	"""
+	first = []
+	second = []
+	for i, keys in enumerate(band_keys(signatures, bands)):
+		candidates = sorted(set(j for key in keys for j in index["buckets"].get(key, [])))
+		first.extend([i] * len(candidates))
+		second.extend(candidates)
+
+	if not first:
+		return []
+
+	first = np.array(first, dtype=np.int64)
+	second = np.array(second, dtype=np.int64)
+	stored = np.array([index["signatures"][j] for j in second], dtype=np.uint32)
+	similar = np.mean(signatures[first] == stored, axis=1) >= threshold
+	return list(zip(first[similar].tolist(), second[similar].tolist()))
+
+
+if __name__ == "__main__":
+	from appreciation_model import LABELS_PATH, load_labelled_examples
+	from linguistic_analysis import get_final_utterances_from_user
+
+	examples = load_labelled_examples(LABELS_PATH)
+	train = [text for text, label, split in examples if split == "train"]
+	validation = [text for text, label, split in examples if split == "validation"]
+	for i, j in find_leakage(train, validation):
+		print("validation example {!r} is a near duplicate of training example {!r}".format(validation[i], train[j]))
+
+	data = json.load(open("frames.json"))
+	final_utterance = get_final_utterances_from_user(data)
+	representatives, weights, cluster = cluster_representatives(final_utterance)
+	print("{} final utterances in {} clusters of near duplicates".format(len(final_utterance), len(representatives)))